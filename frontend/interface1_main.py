@@ -6,6 +6,7 @@ import hashlib
 from datetime import datetime
 import base64
 import fitz  # PyMuPDF for better PDF handling
+from retrieval_index import RetrievalIndex
 
 class FileStatus:
     PROCESSING = "processing"
@@ -24,8 +25,6 @@ def initialize_session_state():
         st.session_state.messages = []
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = defaultdict(list)
-    if 'file_contents' not in st.session_state:
-        st.session_state.file_contents = {}
     if 'file_hashes' not in st.session_state:
         st.session_state.file_hashes = {}
     if 'file_status' not in st.session_state:
@@ -34,6 +33,10 @@ def initialize_session_state():
         st.session_state.file_metadata = {}
     if 'file_data' not in st.session_state:
         st.session_state.file_data = {}
+    if 'retrieval_index' not in st.session_state:
+        st.session_state.retrieval_index = RetrievalIndex()
+    if 'seen_uploads' not in st.session_state:
+        st.session_state.seen_uploads = set()
 
 def truncate_filename(filename, max_length=15):
     name, ext = os.path.splitext(filename)
@@ -113,25 +116,35 @@ def process_file(file):
         }
         raise
 
+def remove_file(filename):
+    file_type = get_file_type(filename)
+    if filename in st.session_state.uploaded_files.get(file_type, []):
+        st.session_state.uploaded_files[file_type].remove(filename)
+        if not st.session_state.uploaded_files[file_type]:
+            del st.session_state.uploaded_files[file_type]
+    # The uploader still holds the file, but its id stays in seen_uploads
+    # so it is not processed again on the next rerun
+    for state in ['file_hashes', 'file_status', 'file_metadata', 'file_data']:
+        st.session_state[state].pop(filename, None)
+    st.session_state.retrieval_index.delete(filename)
+
 def handle_chat_input(prompt):
-    if not st.session_state.file_contents:
+    if not len(st.session_state.retrieval_index):
         return "Please upload and process some documents before asking questions."
 
     # Clear previous messages when new files are uploaded
     st.session_state.messages = []
     
+    documents_by_type = defaultdict(list)
+    for filename, file_type, content in st.session_state.retrieval_index.live_documents():
+        documents_by_type[file_type].append((filename, content))
+
     response = "Based on the processed documents:\n\n"
-    for file_type, filenames in st.session_state.uploaded_files.items():
-        successfully_processed = [
-            f for f in filenames 
-            if st.session_state.file_status.get(f) == FileStatus.COMPLETED
-        ]
-        if successfully_processed:
-            response += f"\n{get_file_type_icon(file_type)} {file_type.upper()} files:\n"
-            for filename in successfully_processed:
-                content = st.session_state.file_contents[filename]
-                content_preview = content[0][:100] + "..." if isinstance(content, tuple) else content[:100] + "..."
-                response += f"- {truncate_filename(filename)}\n  Preview: {content_preview}\n"
+    for file_type, documents in documents_by_type.items():
+        response += f"\n{get_file_type_icon(file_type)} {file_type.upper()} files:\n"
+        for filename, content in documents:
+            content_preview = content[0][:100] + "..." if isinstance(content, tuple) else content[:100] + "..."
+            response += f"- {truncate_filename(filename)}\n  Preview: {content_preview}\n"
     
     return response
 
@@ -154,12 +167,18 @@ def main():
         )
 
         if uploaded_files:
+            new_documents = []
             for file in uploaded_files:
+                # Files handled on an earlier rerun are skipped before reading their bytes
+                if file.file_id in st.session_state.seen_uploads:
+                    continue
+
                 file_content = file.read()
                 file_hash = get_file_hash(file_content)
                 file.seek(0)
                 
                 if file.name in st.session_state.file_hashes and st.session_state.file_hashes[file.name] == file_hash:
+                    st.session_state.seen_uploads.add(file.file_id)
                     st.warning(f'{truncate_filename(file.name)} is a duplicate and was skipped.')
                     continue
                 
@@ -173,13 +192,20 @@ def main():
                             st.session_state.uploaded_files[file_type] = []
                         if file.name not in st.session_state.uploaded_files[file_type]:
                             st.session_state.uploaded_files[file_type].append(file.name)
-                        st.session_state.file_contents[file.name] = text_content
+                        st.session_state.seen_uploads.add(file.file_id)
+                        new_documents.append((file.name, file_type, text_content))
                         st.success(f'Successfully processed {truncate_filename(file.name)}')
                     except Exception as e:
                         st.error(f'Error processing {truncate_filename(file.name)}: {str(e)}')
                         if file.name in st.session_state.file_hashes:
                             del st.session_state.file_hashes[file.name]
 
+            # Only the newly processed files are written, as one new segment
+            st.session_state.retrieval_index.add_segment(new_documents)
+
+        # Forget ids the uploader no longer holds
+        st.session_state.seen_uploads &= {file.file_id for file in uploaded_files or []}
+
         if st.session_state.uploaded_files:
             st.write("### Processed Files")
             
@@ -210,6 +236,11 @@ def main():
                                 # Preview button with unique key
                                 preview_key = f"preview_{filename}"
                                 preview_btn = st.button("👁️", key=preview_key)
+                                remove_btn = st.button("🗑️", key=f"remove_{filename}")
+
+                            if remove_btn:
+                                remove_file(filename)
+                                st.experimental_rerun()
                             
                             if preview_btn:
                                 st.markdown("### File Preview")
@@ -233,11 +264,12 @@ def main():
 
             if st.button("Clear All Files"):
                 st.session_state.uploaded_files = defaultdict(list)
-                st.session_state.file_contents = {}
                 st.session_state.file_hashes = {}
                 st.session_state.file_status = {}
                 st.session_state.file_metadata = {}
                 st.session_state.file_data = {}
+                st.session_state.retrieval_index = RetrievalIndex()
+                st.session_state.seen_uploads = set()
                 st.session_state.messages = []
                 st.experimental_rerun()
 
@@ -0,0 +1,198 @@
+import threading
+from collections import defaultdict
+
+
+class RetrievalIndex:
+    """Segmented document index backing the chat retrieval.
+
+    New uploads are appended as small immutable segments and deletes only
+    record a tombstone. A background thread merges segments of the same size
+    tier and rewrites segments holding tombstones, so ingest cost stays
+    proportional to new data and the segment count stays logarithmic.
+    """
+    MERGE_FACTOR = 4  # Merge once this many segments share a size tier
+    SMALL_SEGMENT_DOCS = 32  # Size of the first tier; its tombstones are always purged
+    MAX_DEAD_RATIO = 0.5  # Rewrite larger segments where most docs are tombstoned
+
+    def __init__(self, background_compaction=True, merge_hook=None):
+        self.segments = []
+        self.segment_by_id = {}
+        self.doc_segment = {}  # doc_id -> id of the segment holding it
+        self.live = {}  # filename -> doc_id of its current version
+        self.tombstones = set()
+        self.next_doc_id = 0
+        self.next_segment_id = 0
+        self.background_compaction = background_compaction
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()  # Serializes merges
+        self.compactor = None
+        # Called after a merged segment is built and before it is swapped in
+        self.merge_hook = merge_hook
+
+    def add_segment(self, documents):
+        """Append one segment for a batch of (filename, file_type, content)."""
+        if not documents:
+            return
+        with self.lock:
+            docs = []
+            for filename, file_type, content in documents:
+                old_doc_id = self.live.get(filename)
+                if old_doc_id is not None:
+                    self._tombstone(old_doc_id)
+                doc_id = self.next_doc_id
+                self.next_doc_id += 1
+                self.live[filename] = doc_id
+                docs.append((doc_id, filename, file_type, content))
+            self._append_segment(docs)
+        self.maybe_compact()
+
+    def delete(self, filename):
+        with self.lock:
+            doc_id = self.live.pop(filename, None)
+            if doc_id is None:
+                return False
+            self._tombstone(doc_id)
+        self.maybe_compact()
+        return True
+
+    def live_documents(self):
+        """Return (filename, file_type, content) for every non-deleted doc."""
+        with self.lock:
+            segments = list(self.segments)
+            tombstones = set(self.tombstones)
+        return [
+            (filename, file_type, content)
+            for segment in segments
+            for doc_id, filename, file_type, content in segment['docs']
+            if doc_id not in tombstones
+        ]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.live)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'documents': len(self.live),
+                'segments': len(self.segments),
+                'tombstones': len(self.tombstones),
+            }
+
+    def _new_segment(self, docs, dead=0):
+        segment = {'id': self.next_segment_id, 'docs': docs, 'dead': dead}
+        self.next_segment_id += 1
+        self.segment_by_id[segment['id']] = segment
+        for doc in docs:
+            self.doc_segment[doc[0]] = segment['id']
+        return segment
+
+    def _append_segment(self, docs):
+        self.segments.append(self._new_segment(docs))
+
+    def _tombstone(self, doc_id):
+        self.tombstones.add(doc_id)
+        self.segment_by_id[self.doc_segment[doc_id]]['dead'] += 1
+
+    def _tier(self, segment):
+        # Tier 0 holds small segments, each next tier is MERGE_FACTOR times larger
+        tier, limit = 0, self.SMALL_SEGMENT_DOCS
+        while len(segment['docs']) >= limit:
+            tier += 1
+            limit *= self.MERGE_FACTOR
+        return tier
+
+    def _pick_merge_candidates(self):
+        """Return the next group of segments to merge, or an empty list."""
+        # Small segments are cheap to rewrite, so any tombstone in them is
+        # purged; larger ones wait until most of their docs are dead
+        dirty = [
+            s for s in self.segments
+            if s['dead'] and (len(s['docs']) < self.SMALL_SEGMENT_DOCS
+                              or s['dead'] > self.MAX_DEAD_RATIO * len(s['docs']))
+        ]
+        if dirty:
+            return dirty
+
+        tiers = defaultdict(list)
+        for segment in self.segments:
+            tiers[self._tier(segment)].append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.MERGE_FACTOR:
+                return tiers[tier]
+        return []
+
+    def maybe_compact(self):
+        if not self.background_compaction:
+            return
+        with self.lock:
+            if self.compactor is not None:
+                return
+            if not self._pick_merge_candidates():
+                return
+            self.compactor = threading.Thread(target=self._run_compactor, daemon=True)
+            self.compactor.start()
+
+    def _run_compactor(self):
+        # Keep merging until no candidates remain, so deletes and uploads
+        # that arrive mid-merge are picked up before the thread exits
+        while True:
+            with self.merge_lock:
+                if not self._merge_once(background=True):
+                    return
+
+    def compact(self):
+        """Merge segments synchronously until no merge candidates are left."""
+        while True:
+            with self.merge_lock:
+                if not self._merge_once():
+                    return
+
+    def _merge_once(self, background=False):
+        with self.lock:
+            candidates = self._pick_merge_candidates()
+            if not candidates:
+                if background:
+                    self.compactor = None
+                return False
+            tombstones = set(self.tombstones)
+        self._merge(candidates, tombstones)
+        return True
+
+    def _merge(self, candidates, tombstones):
+        """Merge candidate segments into one, dropping tombstoned docs."""
+        # Build the merged segment outside the lock so queries and uploads
+        # keep going while it is written
+        rewritten = []
+        for segment in candidates:
+            kept = [doc for doc in segment['docs'] if doc[0] not in tombstones]
+            purged = {doc[0] for doc in segment['docs'] if doc[0] in tombstones}
+            rewritten.append((segment['id'], kept, purged))
+
+        if self.merge_hook is not None:
+            self.merge_hook()
+
+        with self.lock:
+            # Skip segments that another merge already replaced
+            rewritten = [r for r in rewritten if r[0] in self.segment_by_id]
+            if not rewritten:
+                return
+            merged_ids = {segment_id for segment_id, _, _ in rewritten}
+            kept = [doc for _, docs, _ in rewritten for doc in docs]
+            purged = set().union(*(ids for _, _, ids in rewritten))
+
+            segments = []
+            for segment in self.segments:
+                if segment['id'] not in merged_ids:
+                    segments.append(segment)
+                    continue
+                del self.segment_by_id[segment['id']]
+                if kept:
+                    # Deletes issued during the merge stay tombstoned for the kept docs
+                    dead = sum(1 for doc in kept if doc[0] in self.tombstones)
+                    segments.append(self._new_segment(kept, dead))
+                    kept = None
+            self.segments = segments
+            for doc_id in purged:
+                del self.doc_segment[doc_id]
+            self.tombstones -= purged
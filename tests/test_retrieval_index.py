@@ -0,0 +1,179 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'frontend'))
+
+from retrieval_index import RetrievalIndex
+
+SMALL = RetrievalIndex.SMALL_SEGMENT_DOCS
+FACTOR = RetrievalIndex.MERGE_FACTOR
+
+
+def make_index(**kwargs):
+    return RetrievalIndex(background_compaction=False, **kwargs)
+
+
+def batch(prefix, count):
+    return [('%s%d.pdf' % (prefix, i), 'pdf', prefix) for i in range(count)]
+
+
+def filenames(index):
+    return [filename for filename, _, _ in index.live_documents()]
+
+
+def test_add_segment_appends_one_segment_per_batch():
+    index = make_index()
+    index.add_segment([('a.pdf', 'pdf', 'A'), ('b.docx', 'docx', 'B')])
+    index.add_segment([('c.pdf', 'pdf', 'C')])
+    index.add_segment([])
+
+    assert index.stats() == {'documents': 3, 'segments': 2, 'tombstones': 0}
+    assert filenames(index) == ['a.pdf', 'b.docx', 'c.pdf']
+    assert len(index) == 3
+
+
+def test_reupload_replaces_previous_version():
+    index = make_index()
+    index.add_segment([('a.pdf', 'pdf', 'old')])
+    index.add_segment([('a.pdf', 'pdf', 'new')])
+
+    assert index.live_documents() == [('a.pdf', 'pdf', 'new')]
+    assert index.stats() == {'documents': 1, 'segments': 2, 'tombstones': 1}
+
+    index.compact()
+
+    assert index.live_documents() == [('a.pdf', 'pdf', 'new')]
+    assert index.stats() == {'documents': 1, 'segments': 1, 'tombstones': 0}
+
+
+def test_delete_records_tombstone():
+    index = make_index()
+    index.add_segment([('a.pdf', 'pdf', 'A'), ('b.pdf', 'pdf', 'B')])
+
+    assert index.delete('a.pdf')
+    assert not index.delete('a.pdf')
+    assert filenames(index) == ['b.pdf']
+    assert index.stats() == {'documents': 1, 'segments': 1, 'tombstones': 1}
+
+
+def test_compact_merges_small_segments_in_place():
+    index = make_index()
+    index.add_segment(batch('head', SMALL))
+    for i in range(FACTOR):
+        index.add_segment([('f%d.pdf' % i, 'pdf', '')])
+    index.add_segment(batch('tail', SMALL * FACTOR))
+    before = filenames(index)
+
+    index.compact()
+
+    assert index.stats()['segments'] == 3
+    assert filenames(index) == before
+
+
+def test_compact_purges_every_tombstone_in_small_segments():
+    index = make_index()
+    for i in range(FACTOR - 1):
+        index.add_segment([('a%d.pdf' % i, 'pdf', ''), ('b%d.pdf' % i, 'pdf', '')])
+        index.delete('a%d.pdf' % i)
+
+    index.compact()
+
+    assert index.stats() == {'documents': FACTOR - 1, 'segments': 1, 'tombstones': 0}
+    assert filenames(index) == ['b%d.pdf' % i for i in range(FACTOR - 1)]
+
+
+def test_compact_drops_fully_deleted_segment():
+    index = make_index()
+    index.add_segment([('a.pdf', 'pdf', 'A')])
+    index.add_segment([('b.pdf', 'pdf', 'B')])
+    index.delete('a.pdf')
+
+    index.compact()
+
+    assert filenames(index) == ['b.pdf']
+    assert index.stats() == {'documents': 1, 'segments': 1, 'tombstones': 0}
+
+
+def test_compact_rewrites_mostly_deleted_large_segment():
+    index = make_index()
+    index.add_segment(batch('f', SMALL * 2))
+    index.delete('f0.pdf')
+    index.compact()
+    assert index.stats()['tombstones'] == 1
+
+    for i in range(1, SMALL + 1):
+        index.delete('f%d.pdf' % i)
+    index.compact()
+
+    assert index.stats() == {'documents': SMALL - 1, 'segments': 1, 'tombstones': 0}
+
+
+def test_large_segments_merge_by_size_tier():
+    index = make_index()
+    for round_ in range(FACTOR ** 2):
+        index.add_segment(batch('r%d_' % round_, SMALL))
+
+    index.compact()
+
+    assert index.stats() == {'documents': SMALL * FACTOR ** 2, 'segments': 1, 'tombstones': 0}
+
+
+def test_delete_during_merge_stays_tombstoned():
+    def delete_mid_merge():
+        index.merge_hook = None
+        index.delete('f1.pdf')
+
+    index = make_index(merge_hook=delete_mid_merge)
+    for i in range(FACTOR):
+        index.add_segment([('f%d.pdf' % i, 'pdf', '')])
+
+    index.compact()
+
+    assert filenames(index) == ['f0.pdf', 'f2.pdf', 'f3.pdf']
+    assert index.stats() == {'documents': FACTOR - 1, 'segments': 1, 'tombstones': 0}
+
+
+def test_upload_during_merge_is_kept():
+    def upload_mid_merge():
+        index.merge_hook = None
+        index.add_segment([('late.pdf', 'pdf', '')])
+
+    index = make_index(merge_hook=upload_mid_merge)
+    for i in range(FACTOR):
+        index.add_segment([('f%d.pdf' % i, 'pdf', '')])
+
+    index.compact()
+
+    assert filenames(index) == ['f0.pdf', 'f1.pdf', 'f2.pdf', 'f3.pdf', 'late.pdf']
+    assert index.stats() == {'documents': FACTOR + 1, 'segments': 2, 'tombstones': 0}
+
+
+def test_compact_waits_for_background_compactor():
+    index = RetrievalIndex()
+    for i in range(FACTOR * 8):
+        index.add_segment([('f%d.pdf' % i, 'pdf', '')])
+        index.compact()
+        if i % 2 == 0:
+            index.delete('f%d.pdf' % i)
+            index.compact()
+
+    assert filenames(index) == ['f%d.pdf' % i for i in range(1, FACTOR * 8, 2)]
+    assert index.stats()['tombstones'] == 0
+
+
+def test_background_compactor_drains_pending_work():
+    index = RetrievalIndex()
+    for i in range(FACTOR * 3):
+        index.add_segment([('f%d.pdf' % i, 'pdf', '')])
+    for i in range(0, FACTOR * 3, 2):
+        index.delete('f%d.pdf' % i)
+
+    compactor = index.compactor
+    if compactor is not None:
+        compactor.join(timeout=5)
+
+    # Every segment here is small, so no tombstone may survive compaction
+    assert index.compactor is None
+    assert index.stats()['tombstones'] == 0
+    assert index.stats()['segments'] < FACTOR
+    assert filenames(index) == ['f%d.pdf' % i for i in range(1, FACTOR * 3, 2)]